@@ -3,10 +3,292 @@ Order Service Module
 
 This module provides the OrderService class for managing e-commerce orders.
 Handles order creation, payment processing, inventory management, and notifications.
+Each order's lifecycle is driven by an OrderSaga, which unwinds completed steps on failure.
 """
 
-from typing import List, Optional
-from datetime import datetime
+import asyncio
+import contextlib
+import functools
+import inspect
+import operator
+import random
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+
+_price_and_quantity = operator.itemgetter('price', 'quantity')
+_product_and_quantity = operator.itemgetter('product_id', 'quantity')
+
+# Idempotency keys remember their order for 24h; the marker holds a key while its order is placed.
+# The marker's lease only covers placing one order, so a crash mid-claim frees the key quickly.
+IDEMPOTENCY_TTL = 86400
+IDEMPOTENCY_PENDING = '__pending__'
+IDEMPOTENCY_PENDING_TTL = 60
+
+
+class ProductPriceCache:
+    """
+    Local cache of product prices, invalidated by product update events.
+    
+    Entries never expire on their own; they are evicted when the product
+    service announces a change (product.updated), so hot catalog items are
+    served without a lookup while edits still take effect immediately. A
+    fetch that overlaps an invalidation of the same product is returned to
+    its caller but not cached, so an old price can never outlive the event.
+    
+    Attributes:
+        fetch_prices: Async callable taking product ids and returning {product_id: price}
+    
+    Example:
+        >>> cache = ProductPriceCache(product_service.get_prices)
+        >>> asyncio.create_task(cache.consume(subscriber.listen("product.updated")))
+        >>> prices = await cache.get_many([101, 202])
+    """
+    
+    def __init__(self, fetch_prices):
+        self.fetch_prices = fetch_prices
+        self._prices = {}
+        # Invalidation clock: _invalidated_at[pid] is the tick of its latest eviction
+        self._clock = 0
+        self._invalidated_at = {}
+    
+    async def get_many(self, product_ids: List[int], refresh: bool = False) -> Dict[int, float]:
+        """
+        Return prices for the given products, batch-fetching any misses.
+        
+        Args:
+            product_ids: Products to price (duplicates allowed)
+            refresh: Ignore cached entries and refetch (e.g. admin recalculation)
+        
+        Returns:
+            dict: Price per product id; unknown products are omitted
+        """
+        wanted = set(product_ids)
+        missing = wanted if refresh else wanted.difference(self._prices)
+        prices = {pid: self._prices[pid] for pid in wanted - missing}
+        if not missing:
+            return prices
+        
+        started = self._clock
+        fetched = await self.fetch_prices(list(missing))
+        for pid, price in fetched.items():
+            # Skip products invalidated while the fetch was in flight
+            if self._invalidated_at.get(pid, 0) <= started:
+                self._prices[pid] = price
+        prices.update(fetched)
+        return prices
+    
+    def invalidate(self, product_ids: List[int]) -> None:
+        """Evict cached prices for the given products."""
+        self._clock += 1
+        for pid in product_ids:
+            self._prices.pop(pid, None)
+            self._invalidated_at[pid] = self._clock
+    
+    async def consume(self, events) -> None:
+        """Evict entries for each product.updated event from an async event stream."""
+        async for event in events:
+            self.invalidate([event['product_id']])
+
+
+class AsyncBatcher:
+    """
+    Coalesces individual async calls into batched calls.
+    
+    Items passed to add() are buffered until max_size are pending or wait_ms
+    has elapsed since the first one, then handed to fn as a single list. fn
+    returns one result per item, in order; an Exception in that list fails
+    only its own item, while an exception raised by fn fails the whole batch.
+    
+    Attributes:
+        fn: Async callable taking a list of items and returning a list of results
+        max_size: Maximum items per batch
+        wait_ms: Maximum time the first pending item waits, in milliseconds
+    
+    Example:
+        >>> batcher = AsyncBatcher(notification_service.send_order_confirmation_batch)
+        >>> message_id = await batcher.add(order)
+    """
+    
+    def __init__(self, fn, max_size: int = 50, wait_ms: int = 50):
+        self.fn = fn
+        self.max_size = max_size
+        self.wait_ms = wait_ms
+        self._pending = []
+        self._timer = None
+        self._in_flight = set()
+    
+    async def add(self, item):
+        """Queue one item and wait for its result."""
+        results = await self.add_many([item])
+        return results[0]
+    
+    async def add_many(self, items: List) -> List:
+        """Queue several items and wait for all of their results."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._pending.append((item, future))
+            futures.append(future)
+            if len(self._pending) >= self.max_size:
+                self._flush()
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.wait_ms / 1000, self._flush)
+        return await asyncio.gather(*futures)
+    
+    async def flush(self) -> None:
+        """Send anything pending now and wait for every in-flight batch."""
+        self._flush()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+    
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+    
+    async def _send(self, batch: List[tuple]) -> None:
+        try:
+            results = await self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        if results is None:
+            results = [None] * len(batch)
+        elif len(results) != len(batch):
+            error = RuntimeError(
+                f"Batch function returned {len(results)} results for {len(batch)} items"
+            )
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class PooledClient:
+    """
+    Bounds the number of in-flight calls to one downstream client.
+    
+    Acts as a fixed-size connection pool in front of a repository or service
+    handle: every method call that is awaited holds one slot while it is
+    awaited, so a burst of concurrent orders queues here instead of opening a
+    connection per request downstream. This covers async methods and plain
+    callables returning an awaitable (wrapped methods, partials, driver
+    clients); their awaitable is handed back as a coroutine. Results that are
+    async context managers (aiohttp request contexts, asyncpg acquire())
+    come back as a proxy that holds the slot for either `await` or
+    `async with`. Work such a callable starts before returning (e.g. an
+    already-running future) is outside the bound. Non-awaitable results and
+    attributes pass through. The pool's own slot is held with hold_slot(),
+    so a wrapped client's acquire() stays reachable.
+    
+    Attributes:
+        name: Downstream name used in metrics
+        max_size: Maximum number of concurrent calls
+        in_use: Calls currently holding a slot
+        waiting: Calls currently waiting for a slot
+        acquired_total: Slots handed out since creation
+    """
+    
+    def __init__(self, client, max_size: int, name: str):
+        self._client = client
+        self._slots = asyncio.Semaphore(max_size)
+        self.name = name
+        self.max_size = max_size
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired_total = 0
+    
+    def __getattr__(self, attr):
+        value = getattr(self._client, attr)
+        if inspect.iscoroutinefunction(value):
+            @functools.wraps(value)
+            async def pooled_call(*args, **kwargs):
+                async with self.hold_slot():
+                    return await value(*args, **kwargs)
+            return pooled_call
+        if not callable(value):
+            return value
+        
+        @functools.wraps(value)
+        def pooled_sync_call(*args, **kwargs):
+            result = value(*args, **kwargs)
+            if hasattr(result, '__aenter__'):
+                return _PooledContext(self, result)
+            if inspect.isawaitable(result):
+                return self._await_pooled(result)
+            return result
+        return pooled_sync_call
+    
+    async def _await_pooled(self, awaitable):
+        async with self.hold_slot():
+            return await awaitable
+    
+    @contextlib.asynccontextmanager
+    async def hold_slot(self):
+        """Hold one slot, e.g. across several calls that make up a single batch."""
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        self.acquired_total += 1
+        try:
+            yield self._client
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+    
+    def metrics(self) -> dict:
+        """Snapshot of pool usage for capacity planning."""
+        return {
+            'max_size': self.max_size,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'acquired_total': self.acquired_total
+        }
+
+
+class _PooledContext:
+    """A client's async context manager (optionally awaitable) that holds a pool slot while in use."""
+    
+    def __init__(self, pool: PooledClient, context):
+        self._pool = pool
+        self._context = context
+        self._stack = None
+    
+    def __await__(self):
+        return self._pool._await_pooled(self._context).__await__()
+    
+    async def __aenter__(self):
+        async with contextlib.AsyncExitStack() as stack:
+            await stack.enter_async_context(self._pool.hold_slot())
+            entered = await stack.enter_async_context(self._context)
+            self._stack = stack.pop_all()
+        return entered
+    
+    async def __aexit__(self, *exc_info):
+        stack, self._stack = self._stack, None
+        return await stack.__aexit__(*exc_info)
 
 
 class OrderService:
@@ -26,6 +308,14 @@ class OrderService:
         inventory_service: Service for managing product inventory
         notification_service: Service for sending customer notifications
         logger: Logger instance for order operations
+        enable_async: When True, submit_order queues orders for a background worker
+        reservation_attempts: Counter of attempts needed per reservation ('exhausted' on failure)
+        price_cache: Optional ProductPriceCache used to price items by product id
+        idem_cache: Optional key-value store (Redis-like) for idempotency keys
+    
+    The repository, payment and inventory clients are wrapped in PooledClient
+    so concurrent orders share a bounded number of downstream connections.
+    Order confirmations are coalesced by an AsyncBatcher into bulk sends.
     
     Example:
         >>> order_service = OrderService(order_repo, payment_svc, inventory_svc, notif_svc, logger)
@@ -34,7 +324,12 @@ class OrderService:
     """
     
     def __init__(self, order_repository, payment_service, inventory_service, 
-                 notification_service, logger):
+                 notification_service, logger, enable_async: bool = False,
+                 batch_size: int = 500, flush_ms: int = 20,
+                 db_pool_size: int = 50, http_pool_size: int = 100,
+                 price_cache: Optional[ProductPriceCache] = None,
+                 notify_batch_size: int = 50, notify_wait_ms: int = 50,
+                 idem_cache=None):
         """
         Initialize the OrderService with required dependencies.
         
@@ -44,25 +339,134 @@ class OrderService:
             inventory_service: Service for inventory management
             notification_service: Service for notifications
             logger: Logger instance
+            enable_async: Queue submitted orders instead of creating them inline
+            batch_size: Maximum number of queued orders processed together
+            flush_ms: Maximum time to wait for a batch to fill, in milliseconds
+            db_pool_size: Maximum concurrent calls to the order repository
+            http_pool_size: Maximum concurrent calls to payment and inventory services
+            price_cache: Price lookup for items; without it each item's own 'price' is used
+            notify_batch_size: Maximum order confirmations per bulk send
+            notify_wait_ms: Maximum time a confirmation waits for its batch, in milliseconds
+            idem_cache: Store with async get(key), set(key, value, ttl, nx=False) -> bool
+                and delete(key), e.g. a Redis wrapper using SET NX EX
         """
-        self.order_repository = order_repository
-        self.payment_service = payment_service
-        self.inventory_service = inventory_service
+        self.order_repository = PooledClient(order_repository, db_pool_size, 'order_repository')
+        self.payment_service = PooledClient(payment_service, http_pool_size, 'payment_service')
+        self.inventory_service = PooledClient(inventory_service, http_pool_size, 'inventory_service')
         self.notification_service = notification_service
+        self._confirmation_batcher = AsyncBatcher(
+            notification_service.send_order_confirmation_batch,
+            max_size=notify_batch_size,
+            wait_ms=notify_wait_ms
+        )
         self.logger = logger
+        self.price_cache = price_cache
+        self.idem_cache = idem_cache
+        self.reservation_attempts = Counter()
+        self._background_tasks = set()
+        self.enable_async = enable_async
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self._order_queue = asyncio.Queue() if enable_async else None
+        self._worker_task = None
+    
+    async def start(self) -> None:
+        """Start the background order worker (no-op unless enable_async is set or already running)."""
+        if self.enable_async and self._worker_task is None:
+            self._worker_task = asyncio.create_task(self._order_worker())
+    
+    async def stop(self) -> None:
+        """Drain queued orders, stop the background order worker and deliver pending notifications."""
+        if self._worker_task is not None:
+            await self._order_queue.join()
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+            self._worker_task = None
+        # Let fire-and-forget sends (including batcher.add calls) finish first
+        if self._background_tasks:
+            await asyncio.gather(*list(self._background_tasks), return_exceptions=True)
+        await self._confirmation_batcher.flush()
+    
+    def pool_metrics(self) -> dict:
+        """Current usage of each downstream connection pool, keyed by client name."""
+        pools = (self.order_repository, self.payment_service, self.inventory_service)
+        return {pool.name: pool.metrics() for pool in pools}
+    
+    async def submit_order(self, customer_id: int, items: List[dict], 
+                          shipping_address: dict, idempotency_key: Optional[str] = None) -> dict:
+        """
+        Accept an order for creation.
+        
+        With enable_async, the order is validated and queued for the background
+        worker (started here if start() was not called, so stop() always drains
+        it), and a queued placeholder is returned immediately. Otherwise this
+        is equivalent to create_order.
+        
+        Args:
+            customer_id: ID of the customer placing the order
+            items: List of order items with product_id and quantity
+            shipping_address: Dictionary containing shipping address details
+            idempotency_key: Client-supplied key, scoped to the customer; a repeated
+                key returns the first response. For queued orders that is the
+                queued placeholder until the worker runs: the key then maps to the
+                created order, or is cleared if the order fails so a retry resubmits
+        
+        Returns:
+            dict: {'id': order_id, 'status': 'queued'}, or the created order
+        
+        Raises:
+            ValidationError: If order data is invalid
+            DuplicateOrderError: If the same key is still being processed
+        """
+        if not self.enable_async:
+            return await self.create_order(customer_id, items, shipping_address, idempotency_key)
+        
+        self._validate_items(items)
+        
+        cache_key = None
+        if idempotency_key is not None and self.idem_cache is not None:
+            cache_key = self._idempotency_cache_key(customer_id, idempotency_key)
+        
+        order_id = str(uuid.uuid4())
+        queued = {'id': order_id, 'status': 'queued'}
+        
+        async def enqueue():
+            await self.start()
+            await self._order_queue.put({
+                'order_id': order_id,
+                'customer_id': customer_id,
+                'items': items,
+                'shipping_address': shipping_address,
+                'idempotency_key': cache_key
+            })
+            
+            self.logger.info("Order %s queued for customer %s", order_id, customer_id)
+            return queued
+        
+        # The worker settles the key, so the placeholder must be stored before put()
+        return await self._run_idempotent(customer_id, idempotency_key, enqueue,
+                                          placeholder=queued)
     
     async def create_order(self, customer_id: int, items: List[dict], 
-                          shipping_address: dict) -> dict:
+                          shipping_address: dict, idempotency_key: Optional[str] = None,
+                          refresh_prices: bool = False) -> dict:
         """
         Create a new order in the system.
         
-        Validates order data, checks inventory availability, reserves stock,
-        and creates the order record. Does not process payment.
+        Validates order data, atomically checks and reserves stock, and
+        creates the order record. Does not process payment.
         
         Args:
             customer_id: ID of the customer placing the order
             items: List of order items with product_id and quantity
             shipping_address: Dictionary containing shipping address details
+            idempotency_key: Client-supplied key, scoped to the customer; a retried
+                submission with the same key returns the original order without
+                touching inventory or the DB
+            refresh_prices: Bypass cached prices and refetch them (admin recalculation)
         
         Returns:
             dict: Created order object with order_id, status, and total
@@ -70,52 +474,70 @@ class OrderService:
         Raises:
             ValidationError: If order data is invalid
             InsufficientStockError: If requested items are out of stock
+            DuplicateOrderError: If the same key is still being processed
             
         Example:
             >>> items = [{"product_id": 101, "quantity": 2}, {"product_id": 202, "quantity": 1}]
             >>> address = {"street": "123 Main St", "city": "NYC", "zip": "10001"}
             >>> order = await service.create_order(customer_id=456, items=items, shipping_address=address)
         """
-        self.logger.info(f"Creating order for customer {customer_id}")
+        self.logger.info("Creating order for customer %s", customer_id)
         
-        # Validate order items
-        if not items:
-            raise ValidationError("Order must contain at least one item")
+        self._validate_items(items)
         
-        # Check inventory availability
-        for item in items:
-            available = await self.inventory_service.check_availability(
-                item['product_id'], 
-                item['quantity']
-            )
-            if not available:
-                raise InsufficientStockError(
-                    f"Insufficient stock for product {item['product_id']}"
-                )
-        
-        # Reserve inventory
-        reservation_id = await self.inventory_service.reserve_items(items)
+        saga = OrderSaga(self)
+        return await self._run_idempotent(
+            customer_id,
+            idempotency_key,
+            lambda: saga.start(customer_id, items, shipping_address,
+                               refresh_prices=refresh_prices)
+        )
+    
+    @staticmethod
+    def _idempotency_cache_key(customer_id: int, key: str) -> str:
+        """Scope a client idempotency key to its customer."""
+        return f"{customer_id}:{key}"
+    
+    async def _run_idempotent(self, customer_id: int, key: Optional[str], work,
+                              placeholder: Optional[dict] = None):
+        """
+        Run work() at most once per (customer, idempotency key), replaying its result on retries.
         
-        # Calculate order total
-        total = await self._calculate_total(items)
+        The key is claimed atomically (SET NX) before any work starts, so two
+        concurrent retries cannot both place the order. A failed attempt
+        releases the key so the client can retry. Keys are namespaced by
+        customer, so the same key from another customer never replays this one.
         
-        # Create order record
-        order = await self.order_repository.create({
-            'customer_id': customer_id,
-            'items': items,
-            'shipping_address': shipping_address,
-            'total': total,
-            'status': 'pending',
-            'reservation_id': reservation_id,
-            'created_at': datetime.utcnow()
-        })
+        With a placeholder, it is stored as the key's result before work()
+        runs and is not written again afterwards; this is for work that hands
+        the order to someone else who settles the key later (the queue worker).
+        """
+        if key is None or self.idem_cache is None:
+            return await work()
         
-        self.logger.info(f"Order {order['id']} created successfully")
+        key = self._idempotency_cache_key(customer_id, key)
+        existing = await self.idem_cache.get(key)
+        if existing is None and await self.idem_cache.set(
+                key, IDEMPOTENCY_PENDING, ttl=IDEMPOTENCY_PENDING_TTL, nx=True):
+            try:
+                if placeholder is not None:
+                    await self.idem_cache.set(key, placeholder, ttl=IDEMPOTENCY_TTL)
+                result = await work()
+            except BaseException:
+                await self.idem_cache.delete(key)
+                raise
+            if placeholder is None:
+                await self.idem_cache.set(key, result, ttl=IDEMPOTENCY_TTL)
+            return result
         
-        # Send confirmation email
-        await self.notification_service.send_order_confirmation(order)
+        # Lost the claim; the other request may have finished in the meantime
+        if existing is None:
+            existing = await self.idem_cache.get(key)
+        if existing is None or existing == IDEMPOTENCY_PENDING:
+            raise DuplicateOrderError(f"Order with idempotency key {key} is already in progress")
         
-        return order
+        self.logger.info("Replaying order for idempotency key %s", key)
+        return existing
     
     async def process_payment(self, order_id: int, payment_method: str, 
                              payment_details: dict) -> bool:
@@ -141,40 +563,345 @@ class OrderService:
         if not order:
             raise OrderNotFoundError(f"Order {order_id} not found")
         
-        # Attempt payment
-        payment_result = await self.payment_service.charge(
-            amount=order['total'],
-            method=payment_method,
-            details=payment_details
+        saga = OrderSaga.resume(self, order)
+        if await saga.pay(payment_method, payment_details):
+            self.logger.info("Payment processed successfully for order %s", order_id)
+            return True
+        
+        self.logger.error("Payment failed for order %s: %s", order_id, saga.ctx['payment_result'].error)
+        return False
+    
+    async def _order_worker(self) -> None:
+        """Consume the submit queue, placing buffered orders batch by batch."""
+        while True:
+            batch = await self._next_order_batch()
+            try:
+                await self._place_order_batch(batch)
+            except Exception as e:
+                self.logger.error("Failed to place batch of %s queued orders: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._order_queue.task_done()
+    
+    async def _place_order_batch(self, batch: List[dict]) -> List[dict]:
+        """Reserve queued orders concurrently, then persist and announce them in bulk."""
+        sagas = [OrderSaga(self) for _ in batch]
+        reserved = await asyncio.gather(
+            *(saga.reserve(request['customer_id'], request['items'],
+                           request['shipping_address'], request['order_id'])
+              for saga, request in zip(sagas, batch)),
+            return_exceptions=True
         )
         
-        if payment_result.success:
-            # Update order status
-            await self.order_repository.update(order_id, {
-                'status': 'paid',
-                'payment_id': payment_result.transaction_id,
-                'paid_at': datetime.utcnow()
-            })
-            
-            # Confirm inventory reservation
-            await self.inventory_service.confirm_reservation(order['reservation_id'])
-            
-            # Send payment confirmation
-            await self.notification_service.send_payment_confirmation(order)
-            
-            self.logger.info(f"Payment processed successfully for order {order_id}")
-            return True
-        else:
-            # Release inventory reservation
-            await self.inventory_service.release_reservation(order['reservation_id'])
-            
-            self.logger.error(f"Payment failed for order {order_id}: {payment_result.error}")
-            return False
+        pending, pending_keys, failed_keys = [], [], []
+        for saga, request, result in zip(sagas, batch, reserved):
+            if isinstance(result, Exception):
+                self.logger.error("Queued order %s failed: %s", request['order_id'], result)
+                failed_keys.append(request['idempotency_key'])
+            else:
+                pending.append(saga)
+                pending_keys.append(request['idempotency_key'])
+        
+        # Failed orders must not keep replaying their queued placeholder
+        await self._forget_idempotency_keys(failed_keys)
+        if not pending:
+            return []
+        
+        # One multi-row insert for the whole batch; unwind every reservation if it fails
+        try:
+            orders = await self.order_repository.create_batch(
+                [saga.ctx['record'] for saga in pending]
+            )
+            if len(orders) != len(pending):
+                raise RuntimeError(
+                    f"create_batch returned {len(orders)} orders for {len(pending)} records"
+                )
+        except Exception:
+            await asyncio.gather(*(saga.compensate() for saga in pending))
+            await self._forget_idempotency_keys(pending_keys)
+            raise
+        for saga, order in zip(pending, orders):
+            saga.mark_created(order)
+            self.logger.info("Order %s created successfully", order['id'])
+        
+        # Replays of a queued submission now return the created order
+        await asyncio.gather(
+            *(self.idem_cache.set(key, order, ttl=IDEMPOTENCY_TTL)
+              for key, order in zip(pending_keys, orders) if key is not None),
+            return_exceptions=True
+        )
+        
+        # Send confirmation emails without blocking the worker
+        self._run_in_background(self._confirmation_batcher.add_many(orders))
+        
+        return orders
+    
+    async def _next_order_batch(self) -> List[dict]:
+        """Wait for one queued order, then buffer more until batch_size or flush_ms."""
+        batch = [await self._order_queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_ms / 1000
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._order_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _forget_idempotency_keys(self, keys: List[Optional[str]]) -> None:
+        """Release idempotency claims so the clients can retry those orders."""
+        await asyncio.gather(
+            *(self.idem_cache.delete(key) for key in keys if key is not None),
+            return_exceptions=True
+        )
+    
+    @staticmethod
+    def _validate_items(items: List[dict]) -> None:
+        """Reject orders that have no items."""
+        if not items:
+            raise ValidationError("Order must contain at least one item")
+    
+    def _run_in_background(self, coro) -> asyncio.Task:
+        """Schedule a fire-and-forget coroutine, keeping a reference until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+        return task
     
-    async def _calculate_total(self, items: List[dict]) -> float:
-        """Calculate the total price for order items including tax and shipping."""
-        subtotal = sum(item['price'] * item['quantity'] for item in items)
+    def _on_background_done(self, task: asyncio.Task) -> None:
+        """Release a finished background task and log any failure."""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Background task failed: %s", task.exception())
+    
+    async def _reserve_with_retry(self, items: List[dict], max_attempts: int = 5):
+        """
+        Reserve items, retrying optimistic-lock conflicts with jittered exponential backoff.
+        
+        A conflict only means another writer committed first, so the reservation
+        is retried rather than surfaced. The number of attempts each reservation
+        needed is tallied in reservation_attempts for tuning.
+        """
+        for attempt in range(1, max_attempts + 1):
+            try:
+                reservation = await self.inventory_service.reserve_items_atomic(items)
+            except OptimisticLockError:
+                if attempt == max_attempts:
+                    self.reservation_attempts['exhausted'] += 1
+                    self.logger.error("Reservation still conflicting after %s attempts", attempt)
+                    raise
+                delay = min(0.05 * 2 ** (attempt - 1), 0.5) * (0.5 + random.random())
+                await asyncio.sleep(delay)
+            else:
+                self.reservation_attempts[attempt] += 1
+                return reservation
+    
+    async def _calculate_total(self, items: List[dict], refresh_prices: bool = False) -> float:
+        """Calculate the total price for order items including tax and shipping.
+        
+        With a price cache, refresh_prices refetches every price instead of
+        using cached entries.
+        """
+        if self.price_cache is None:
+            subtotal = sum(price * quantity for price, quantity in map(_price_and_quantity, items))
+        else:
+            lines = [_product_and_quantity(item) for item in items]
+            prices = await self.price_cache.get_many([pid for pid, _ in lines],
+                                                     refresh=refresh_prices)
+            unknown = [pid for pid, _ in lines if pid not in prices]
+            if unknown:
+                raise ValidationError(f"Unknown products {unknown}")
+            subtotal = sum(prices[pid] * quantity for pid, quantity in lines)
         tax = subtotal * 0.08  # 8% tax
         shipping = 10.00 if subtotal < 50 else 0  # Free shipping over $50
         return subtotal + tax + shipping
 
+
+class OrderSaga:
+    """
+    Orchestrates one order through its lifecycle as a sequence of transitions.
+    
+    States advance pending -> reserved -> created -> paid -> confirmed. Each
+    transition may register a compensation; when a later transition fails,
+    the registered compensations run in reverse order so the order never
+    leaves stock reserved or a charge in place without a matching record.
+    
+    Attributes:
+        service: OrderService providing the repository and downstream clients
+        state: Name of the last state successfully entered
+        ctx: Data accumulated by the transitions (items, record, order, ...)
+    
+    Example:
+        >>> saga = OrderSaga(order_service)
+        >>> order = await saga.start(customer_id=456, items=items, shipping_address=address)
+        >>> paid = await OrderSaga.resume(order_service, order).pay("credit_card", details)
+    """
+    
+    def __init__(self, service: OrderService):
+        self.service = service
+        self.state = 'pending'
+        self.ctx = {}
+        self._compensations = []
+    
+    @classmethod
+    def resume(cls, service: OrderService, order: dict) -> 'OrderSaga':
+        """Rebuild the saga for a persisted order whose stock is still reserved."""
+        saga = cls(service)
+        saga.ctx['order'] = order
+        saga.ctx['reservation_id'] = order['reservation_id']
+        saga.state = 'created'
+        saga._compensations.append(saga.compensate_reserved)
+        return saga
+    
+    async def start(self, customer_id: int, items: List[dict], 
+                   shipping_address: dict, order_id: Optional[str] = None,
+                   refresh_prices: bool = False) -> dict:
+        """Reserve stock for and persist a validated order, returning the created order."""
+        await self.reserve(customer_id, items, shipping_address, order_id, refresh_prices)
+        await self._transition('created', self.on_enter_created)
+        return self.ctx['order']
+    
+    async def reserve(self, customer_id: int, items: List[dict], 
+                     shipping_address: dict, order_id: Optional[str] = None,
+                     refresh_prices: bool = False) -> dict:
+        """Reserve stock and price the order, returning the record to persist."""
+        self.ctx.update(customer_id=customer_id, items=items,
+                        shipping_address=shipping_address, order_id=order_id,
+                        refresh_prices=refresh_prices)
+        await self._transition('reserved', self.on_enter_reserved, self.compensate_reserved)
+        return self.ctx['record']
+    
+    def mark_created(self, order: dict) -> None:
+        """Record an order persisted outside the saga (e.g. by a batch insert)."""
+        self.ctx['order'] = order
+        self.state = 'created'
+    
+    async def pay(self, payment_method: str, payment_details: dict) -> bool:
+        """
+        Charge and confirm the order; returns False if the payment was declined.
+        
+        Only a definitive decline unwinds the reservation. A charge that raises
+        (e.g. a timeout) has an unknown outcome - the customer may have been
+        charged - so the error propagates with the stock still reserved,
+        leaving the order to be reconciled against the payment provider.
+        """
+        self.ctx.update(payment_method=payment_method, payment_details=payment_details)
+        if not await self._transition('paid', self.on_enter_paid, self.compensate_paid,
+                                      unwind_on_error=False):
+            return False
+        await self._transition('confirmed', self.on_enter_confirmed)
+        return True
+    
+    async def compensate(self) -> None:
+        """Undo every completed transition, most recent first."""
+        while self._compensations:
+            compensation = self._compensations.pop()
+            try:
+                await compensation()
+            except Exception as e:
+                self.service.logger.error("Compensation %s failed: %s", compensation.__name__, e)
+        self.state = 'compensated'
+    
+    async def _transition(self, state: str, action, compensation=None,
+                          unwind_on_error: bool = True) -> bool:
+        """
+        Enter state by running action; unwind on a False result, and on an
+        exception unless unwind_on_error is False (outcome unknown).
+        """
+        try:
+            completed = await action()
+        except Exception:
+            if unwind_on_error:
+                await self.compensate()
+            raise
+        if completed is False:
+            await self.compensate()
+            return False
+        
+        self.state = state
+        if compensation is not None:
+            self._compensations.append(compensation)
+        return True
+    
+    async def on_enter_reserved(self) -> None:
+        """Atomically check and reserve inventory while pricing the order."""
+        items = self.ctx['items']
+        reservation, total = await asyncio.gather(
+            self.service._reserve_with_retry(items),
+            self.service._calculate_total(items, self.ctx['refresh_prices']),
+            return_exceptions=True
+        )
+        if isinstance(reservation, Exception):
+            raise reservation
+        if not reservation.ok:
+            raise InsufficientStockError(
+                f"Insufficient stock for products {reservation.insufficient}"
+            )
+        if isinstance(total, Exception):
+            await self.service.inventory_service.release_reservation(reservation.reservation_id)
+            raise total
+        
+        record = {
+            'customer_id': self.ctx['customer_id'],
+            'items': items,
+            'shipping_address': self.ctx['shipping_address'],
+            'total': total,
+            'status': 'pending',
+            'reservation_id': reservation.reservation_id,
+            'created_at': datetime.now(timezone.utc)
+        }
+        if self.ctx['order_id'] is not None:
+            record['id'] = self.ctx['order_id']
+        self.ctx['record'] = record
+        self.ctx['reservation_id'] = reservation.reservation_id
+    
+    async def on_enter_created(self) -> None:
+        """Persist the order record and queue the confirmation email."""
+        order = await self.service.order_repository.create(self.ctx['record'])
+        self.ctx['order'] = order
+        
+        self.service.logger.info("Order %s created successfully", order['id'])
+        
+        # Send confirmation email without blocking the caller (coalesced into bulk sends)
+        self.service._run_in_background(self.service._confirmation_batcher.add(order))
+    
+    async def on_enter_paid(self) -> bool:
+        """Charge the customer; a declined payment fails the transition."""
+        payment_result = await self.service.payment_service.charge(
+            amount=self.ctx['order']['total'],
+            method=self.ctx['payment_method'],
+            details=self.ctx['payment_details']
+        )
+        self.ctx['payment_result'] = payment_result
+        return payment_result.success
+    
+    async def on_enter_confirmed(self) -> None:
+        """Mark the order paid, confirm the reservation and notify the customer."""
+        order = self.ctx['order']
+        payment_result = self.ctx['payment_result']
+        
+        # Confirm the reservation before marking the order paid: if confirming
+        # fails, the row is untouched and the refund/release leave it consistent
+        await self.service.inventory_service.confirm_reservation(order['reservation_id'])
+        await self.service.order_repository.update(order['id'], {
+            'status': 'paid',
+            'payment_id': payment_result.transaction_id,
+            'paid_at': datetime.now(timezone.utc)
+        })
+        
+        # Send payment confirmation without blocking the caller
+        self.service._run_in_background(
+            self.service.notification_service.send_payment_confirmation(order)
+        )
+    
+    async def compensate_reserved(self) -> None:
+        """Release the inventory held for this order."""
+        await self.service.inventory_service.release_reservation(self.ctx['reservation_id'])
+    
+    async def compensate_paid(self) -> None:
+        """Refund a charge whose order could not be confirmed."""
+        await self.service.payment_service.refund(self.ctx['payment_result'].transaction_id)
+
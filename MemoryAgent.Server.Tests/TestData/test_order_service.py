@@ -0,0 +1,485 @@
+"""
+Tests for the OrderService sample module (SmartEmbedding_Python_Test.py)
+
+Run with: python -m unittest discover -s MemoryAgent.Server.Tests/TestData
+"""
+
+import asyncio
+import importlib.util
+import logging
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+_spec = importlib.util.spec_from_file_location(
+    "order_service", Path(__file__).with_name("SmartEmbedding_Python_Test.py")
+)
+order_service = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(order_service)
+
+
+# The sample module expects these to be provided by the application
+class ValidationError(Exception):
+    pass
+
+
+class InsufficientStockError(Exception):
+    pass
+
+
+class OrderNotFoundError(Exception):
+    pass
+
+
+class OptimisticLockError(Exception):
+    pass
+
+
+order_service.ValidationError = ValidationError
+order_service.InsufficientStockError = InsufficientStockError
+order_service.OrderNotFoundError = OrderNotFoundError
+order_service.OptimisticLockError = OptimisticLockError
+order_service.DuplicateOrderError = type('DuplicateOrderError', (Exception,), {})
+
+ITEMS = [{'product_id': 1, 'quantity': 2, 'price': 5.0}]
+
+
+class FakeRepository:
+    def __init__(self):
+        self.rows = {}
+
+    async def create(self, record):
+        order = dict(record)
+        order.setdefault('id', len(self.rows) + 1)
+        self.rows[order['id']] = order
+        return order
+
+    async def create_batch(self, records):
+        return [await self.create(record) for record in records]
+
+    async def get_by_id(self, order_id):
+        return self.rows.get(order_id)
+
+    async def update(self, order_id, changes):
+        self.rows[order_id].update(changes)
+
+
+class FakeInventory:
+    def __init__(self, fail_confirm=False):
+        self.fail_confirm = fail_confirm
+        self.released = []
+        self.confirmed = []
+
+    async def reserve_items_atomic(self, items):
+        return types.SimpleNamespace(ok=True, reservation_id='r1', insufficient=[])
+
+    async def confirm_reservation(self, reservation_id):
+        if self.fail_confirm:
+            raise RuntimeError("inventory unavailable")
+        self.confirmed.append(reservation_id)
+
+    async def release_reservation(self, reservation_id):
+        self.released.append(reservation_id)
+
+
+class FakePayments:
+    def __init__(self):
+        self.refunded = []
+
+    async def charge(self, amount, method, details):
+        return types.SimpleNamespace(success=True, transaction_id='t1', error=None)
+
+    async def refund(self, transaction_id):
+        self.refunded.append(transaction_id)
+
+
+class FakeNotifications:
+    def __init__(self):
+        self.sent = []
+
+    async def send_order_confirmation_batch(self, orders):
+        self.sent.extend(order['id'] for order in orders)
+
+    async def send_payment_confirmation(self, order):
+        pass
+
+
+class FakeIdempotencyCache:
+    def __init__(self):
+        self.entries = {}
+        self.ttls = []
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, value, ttl, nx=False):
+        if nx and key in self.entries:
+            return False
+        self.entries[key] = value
+        self.ttls.append((value, ttl))
+        return True
+
+    async def delete(self, key):
+        self.entries.pop(key, None)
+
+
+class SlowIdempotencyCache(FakeIdempotencyCache):
+    """Cache whose writes land after the queue worker has had time to run"""
+
+    async def set(self, key, value, ttl, nx=False):
+        await asyncio.sleep(0.05)
+        return await super().set(key, value, ttl, nx)
+
+
+class OutOfStockInventory(FakeInventory):
+    async def reserve_items_atomic(self, items):
+        return types.SimpleNamespace(ok=False, reservation_id=None, insufficient=[1])
+
+
+def make_service(**overrides):
+    deps = {
+        'order_repository': FakeRepository(),
+        'payment_service': FakePayments(),
+        'inventory_service': FakeInventory(),
+        'notification_service': FakeNotifications(),
+        'logger': logging.getLogger("test_order_service"),
+    }
+    deps.update(overrides)
+    return order_service.OrderService(**deps), deps
+
+
+class OrderSagaTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_payment_confirms_reservation_and_marks_paid(self):
+        service, deps = make_service()
+        order = await service.create_order(1, ITEMS, {})
+
+        self.assertTrue(await service.process_payment(order['id'], 'credit_card', {}))
+
+        self.assertEqual(deps['order_repository'].rows[order['id']]['status'], 'paid')
+        self.assertEqual(deps['inventory_service'].confirmed, ['r1'])
+        self.assertEqual(deps['payment_service'].refunded, [])
+
+    async def test_failed_confirmation_leaves_order_unpaid(self):
+        inventory = FakeInventory(fail_confirm=True)
+        service, deps = make_service(inventory_service=inventory)
+        order = await service.create_order(1, ITEMS, {})
+
+        with self.assertRaises(RuntimeError):
+            await service.process_payment(order['id'], 'credit_card', {})
+
+        row = deps['order_repository'].rows[order['id']]
+        self.assertEqual(row['status'], 'pending')
+        self.assertNotIn('payment_id', row)
+        self.assertEqual(deps['payment_service'].refunded, ['t1'])
+        self.assertEqual(inventory.released, ['r1'])
+
+    async def test_declined_payment_releases_reservation(self):
+        class DecliningPayments(FakePayments):
+            async def charge(self, amount, method, details):
+                return types.SimpleNamespace(success=False, transaction_id=None, error='declined')
+
+        service, deps = make_service(payment_service=DecliningPayments())
+        order = await service.create_order(1, ITEMS, {})
+
+        self.assertFalse(await service.process_payment(order['id'], 'credit_card', {}))
+
+        self.assertEqual(deps['inventory_service'].released, ['r1'])
+
+    async def test_charge_error_keeps_reservation(self):
+        class TimingOutPayments(FakePayments):
+            async def charge(self, amount, method, details):
+                raise TimeoutError("payment provider timed out")
+
+        service, deps = make_service(payment_service=TimingOutPayments())
+        order = await service.create_order(1, ITEMS, {})
+
+        with self.assertRaises(TimeoutError):
+            await service.process_payment(order['id'], 'credit_card', {})
+
+        self.assertEqual(deps['inventory_service'].released, [])
+        self.assertEqual(deps['order_repository'].rows[order['id']]['status'], 'pending')
+
+
+class ReservationRetryTests(unittest.IsolatedAsyncioTestCase):
+
+    class ConflictingInventory(FakeInventory):
+        def __init__(self, errors):
+            super().__init__()
+            self.errors = list(errors)
+            self.calls = 0
+
+        async def reserve_items_atomic(self, items):
+            self.calls += 1
+            if self.errors:
+                raise self.errors.pop(0)
+            return await super().reserve_items_atomic(items)
+
+    async def test_succeeds_after_conflicts(self):
+        inventory = self.ConflictingInventory([OptimisticLockError(), OptimisticLockError()])
+        service, _ = make_service(inventory_service=inventory)
+
+        with mock.patch.object(order_service.asyncio, 'sleep', new=mock.AsyncMock()) as sleep:
+            reservation = await service._reserve_with_retry(ITEMS)
+
+        self.assertEqual(reservation.reservation_id, 'r1')
+        self.assertEqual(inventory.calls, 3)
+        self.assertEqual(sleep.await_count, 2)
+        self.assertEqual(service.reservation_attempts, {3: 1})
+
+    async def test_exhausted_retries_reraise(self):
+        inventory = self.ConflictingInventory([OptimisticLockError()] * 5)
+        service, _ = make_service(inventory_service=inventory)
+
+        with mock.patch.object(order_service.asyncio, 'sleep', new=mock.AsyncMock()) as sleep:
+            with self.assertRaises(OptimisticLockError):
+                await service._reserve_with_retry(ITEMS, max_attempts=5)
+
+        self.assertEqual(inventory.calls, 5)
+        self.assertEqual(sleep.await_count, 4)
+        self.assertEqual(service.reservation_attempts, {'exhausted': 1})
+
+    async def test_other_errors_are_not_retried(self):
+        inventory = self.ConflictingInventory([ConnectionError("inventory down")])
+        service, _ = make_service(inventory_service=inventory)
+
+        with mock.patch.object(order_service.asyncio, 'sleep', new=mock.AsyncMock()) as sleep:
+            with self.assertRaises(ConnectionError):
+                await service._reserve_with_retry(ITEMS)
+
+        self.assertEqual(inventory.calls, 1)
+        sleep.assert_not_awaited()
+        self.assertEqual(service.reservation_attempts, {})
+
+
+class OrderServiceShutdownTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_stop_delivers_confirmation_queued_by_create_order(self):
+        service, deps = make_service()
+        order = await service.create_order(1, ITEMS, {})
+
+        await service.stop()
+
+        self.assertEqual(deps['notification_service'].sent, [order['id']])
+        self.assertEqual(service._background_tasks, set())
+
+    async def test_submit_without_start_is_still_drained_by_stop(self):
+        service, deps = make_service(enable_async=True)
+
+        queued = await service.submit_order(1, ITEMS, {})
+        await service.stop()
+
+        self.assertEqual(deps['order_repository'].rows[queued['id']]['status'], 'pending')
+        self.assertEqual(deps['notification_service'].sent, [queued['id']])
+
+
+class IdempotencyTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_key_from_another_customer_is_not_replayed(self):
+        service, _ = make_service(idem_cache=FakeIdempotencyCache())
+
+        first = await service.create_order(1, ITEMS, {}, idempotency_key='k')
+        retry = await service.create_order(1, ITEMS, {}, idempotency_key='k')
+        other = await service.create_order(2, ITEMS, {}, idempotency_key='k')
+
+        self.assertEqual(retry['id'], first['id'])
+        self.assertNotEqual(other['id'], first['id'])
+        self.assertEqual(other['customer_id'], 2)
+
+    async def test_pending_claim_has_short_lease(self):
+        cache = FakeIdempotencyCache()
+        service, _ = make_service(idem_cache=cache)
+
+        order = await service.create_order(1, ITEMS, {}, idempotency_key='k')
+
+        self.assertEqual(cache.ttls, [
+            (order_service.IDEMPOTENCY_PENDING, order_service.IDEMPOTENCY_PENDING_TTL),
+            (order, order_service.IDEMPOTENCY_TTL),
+        ])
+        self.assertLess(order_service.IDEMPOTENCY_PENDING_TTL, order_service.IDEMPOTENCY_TTL)
+
+    async def test_failed_queued_order_releases_its_key(self):
+        cache = FakeIdempotencyCache()
+        service, _ = make_service(inventory_service=OutOfStockInventory(), idem_cache=cache,
+                                  enable_async=True)
+        await service.start()
+
+        queued = await service.submit_order(1, ITEMS, {}, idempotency_key='k')
+        await service.stop()
+
+        self.assertEqual(queued['status'], 'queued')
+        self.assertEqual(cache.entries, {})
+
+    async def test_queued_order_key_maps_to_created_order(self):
+        cache = FakeIdempotencyCache()
+        service, _ = make_service(idem_cache=cache, enable_async=True)
+        await service.start()
+
+        queued = await service.submit_order(1, ITEMS, {}, idempotency_key='k')
+        await service.stop()
+        replay = await service.submit_order(1, ITEMS, {}, idempotency_key='k')
+
+        self.assertEqual(replay['id'], queued['id'])
+        self.assertEqual(replay['status'], 'pending')
+
+    async def test_slow_cache_does_not_restore_failed_orders_placeholder(self):
+        cache = SlowIdempotencyCache()
+        service, _ = make_service(inventory_service=OutOfStockInventory(), idem_cache=cache,
+                                  enable_async=True, flush_ms=1)
+        await service.start()
+
+        await service.submit_order(1, ITEMS, {}, idempotency_key='k')
+        await service.stop()
+
+        self.assertEqual(cache.entries, {})
+
+    async def test_slow_cache_does_not_overwrite_created_order(self):
+        cache = SlowIdempotencyCache()
+        service, _ = make_service(idem_cache=cache, enable_async=True, flush_ms=1)
+        await service.start()
+
+        queued = await service.submit_order(1, ITEMS, {}, idempotency_key='k')
+        await service.stop()
+
+        self.assertEqual(cache.entries['1:k']['id'], queued['id'])
+        self.assertEqual(cache.entries['1:k']['status'], 'pending')
+
+
+class OrderBatchTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_short_create_batch_unwinds_every_order(self):
+        class ShortRepository(FakeRepository):
+            async def create_batch(self, records):
+                return await super().create_batch(records[:1])
+
+        cache = FakeIdempotencyCache()
+        inventory = FakeInventory()
+        service, _ = make_service(order_repository=ShortRepository(), inventory_service=inventory,
+                                  idem_cache=cache, enable_async=True, flush_ms=50)
+        await service.start()
+
+        await asyncio.gather(
+            service.submit_order(1, ITEMS, {}, idempotency_key='a'),
+            service.submit_order(1, ITEMS, {}, idempotency_key='b'),
+        )
+        await service.stop()
+
+        self.assertEqual(inventory.released, ['r1', 'r1'])
+        self.assertEqual(cache.entries, {})
+
+
+class ProductPriceCacheTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_invalidation_during_fetch_is_not_overwritten(self):
+        fetch_started = asyncio.Event()
+        release_fetch = asyncio.Event()
+        fetches = []
+
+        async def fetch_prices(product_ids):
+            fetches.append(sorted(product_ids))
+            fetch_started.set()
+            await release_fetch.wait()
+            return {pid: 10.0 for pid in product_ids}
+
+        cache = order_service.ProductPriceCache(fetch_prices)
+        lookup = asyncio.create_task(cache.get_many([1]))
+        await fetch_started.wait()
+        cache.invalidate([1])
+        release_fetch.set()
+
+        self.assertEqual(await lookup, {1: 10.0})
+        await cache.get_many([1])
+        self.assertEqual(fetches, [[1], [1]])
+
+    async def test_refresh_prices_bypasses_cache_from_create_order(self):
+        fetches = []
+
+        async def fetch_prices(product_ids):
+            fetches.append(sorted(product_ids))
+            return {pid: 20.0 for pid in product_ids}
+
+        service, _ = make_service(price_cache=order_service.ProductPriceCache(fetch_prices))
+        await service.create_order(1, ITEMS, {})
+        await service.create_order(1, ITEMS, {})
+        await service.create_order(1, ITEMS, {}, refresh_prices=True)
+
+        self.assertEqual(fetches, [[1], [1]])
+
+
+class AsyncBatcherTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_result_count_mismatch_fails_every_item(self):
+        async def send(items):
+            return [1]
+
+        batcher = order_service.AsyncBatcher(send, max_size=2, wait_ms=10)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.add('a'), batcher.add('b'), return_exceptions=True),
+            timeout=1
+        )
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+
+class PooledClientTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_plain_callable_returning_awaitable_is_bounded(self):
+        class Client:
+            async def _fetch(self, value):
+                return value
+
+            def fetch(self, value):
+                return self._fetch(value)
+
+            def describe(self):
+                return "client"
+
+        pool = order_service.PooledClient(Client(), max_size=1, name='client')
+
+        self.assertEqual(await pool.fetch(3), 3)
+        self.assertEqual(pool.describe(), "client")
+        self.assertEqual(pool.metrics()['acquired_total'], 1)
+
+    async def test_async_context_manager_result_supports_async_with_and_await(self):
+        class Response:
+            def __init__(self, log):
+                self.log = log
+
+            def __await__(self):
+                yield from asyncio.sleep(0).__await__()
+                return 'awaited'
+
+            async def __aenter__(self):
+                self.log.append('enter')
+                return 'entered'
+
+            async def __aexit__(self, *exc_info):
+                self.log.append('exit')
+
+        class Client:
+            def __init__(self):
+                self.log = []
+
+            def get(self, url):
+                return Response(self.log)
+
+            def acquire(self):
+                return 'connection'
+
+        client = Client()
+        pool = order_service.PooledClient(client, max_size=1, name='client')
+
+        async with pool.get('/orders') as body:
+            self.assertEqual(body, 'entered')
+            self.assertEqual(pool.metrics()['in_use'], 1)
+        self.assertEqual(await pool.get('/orders'), 'awaited')
+
+        self.assertEqual(client.log, ['enter', 'exit'])
+        self.assertEqual(pool.metrics()['in_use'], 0)
+        self.assertEqual(pool.metrics()['acquired_total'], 2)
+        self.assertEqual(pool.acquire(), 'connection')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of Python parse summaries keyed by (path, mtime, size)
+"""
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+CACHE_DIR = Path.home() / ".cache" / "memoryagent" / "ast"
+
+# Bump when the summary layout changes so stale pickles are ignored
+CACHE_VERSION = 2
+
+
+def cache_key(path, st, namespace=""):
+    """Key a file by absolute path + mtime + size, so any edit invalidates it"""
+    abspath = os.path.abspath(path)
+    raw = f"{CACHE_VERSION}|{namespace}|{abspath}|{st.st_mtime_ns}|{st.st_size}".encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def get_or_parse(path, parse):
+    """
+    Return (summary, from_cache) for a source file.
+
+    parse(code, path) is only called on a cache miss, with the raw file bytes;
+    its result is pickled under CACHE_DIR. Entries never expire - a changed
+    mtime or size simply produces a different key. Each parse function gets
+    its own namespace, so summaries from different parsers never mix.
+    """
+    st = os.stat(path)
+    cache_file = CACHE_DIR / f"{cache_key(path, st, parse.__qualname__)}.pkl"
+
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f), True
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    with open(path, 'rb') as f:
+        code = f.read()
+    summary = parse(code, path)
+
+    # Write to a temp file and rename so concurrent readers never see a partial pickle
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # Caching is best-effort
+
+    return summary, False
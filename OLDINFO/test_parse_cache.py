@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-disk parse summary cache (parse_cache.get_or_parse)
+
+Run with: python -m unittest discover -s OLDINFO
+"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import parse_cache
+
+
+def count_lines(code, path):
+    count_lines.calls += 1
+    return {'lines': code.count(b'\n')}
+
+
+def count_bytes(code, path):
+    count_bytes.calls += 1
+    return {'bytes': len(code)}
+
+
+class GetOrParseTests(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(parse_cache, 'CACHE_DIR', Path(tmp.name) / 'cache')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        count_lines.calls = count_bytes.calls = 0
+
+        self.path = os.path.join(tmp.name, 'module.py')
+        self.write(b"a = 1\n")
+
+    def write(self, code, mtime_ns=1_000_000_000):
+        with open(self.path, 'wb') as f:
+            f.write(code)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_miss_then_hit(self):
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_lines), ({'lines': 1}, False))
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_lines), ({'lines': 1}, True))
+        self.assertEqual(count_lines.calls, 1)
+
+    def test_mtime_change_invalidates(self):
+        parse_cache.get_or_parse(self.path, count_lines)
+        self.write(b"a = 2\n", mtime_ns=2_000_000_000)
+
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_lines), ({'lines': 1}, False))
+        self.assertEqual(count_lines.calls, 2)
+
+    def test_size_change_invalidates(self):
+        parse_cache.get_or_parse(self.path, count_lines)
+        self.write(b"a = 1\nb = 2\n")
+
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_lines), ({'lines': 2}, False))
+
+    def test_parse_functions_do_not_share_entries(self):
+        parse_cache.get_or_parse(self.path, count_lines)
+
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_bytes), ({'bytes': 6}, False))
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_lines), ({'lines': 1}, True))
+
+    def test_corrupt_entry_is_reparsed(self):
+        parse_cache.get_or_parse(self.path, count_lines)
+        for entry in parse_cache.CACHE_DIR.glob('*.pkl'):
+            entry.write_bytes(b'not a pickle')
+
+        self.assertEqual(parse_cache.get_or_parse(self.path, count_lines), ({'lines': 1}, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,91 +4,423 @@ Test Python AST Parser manually to debug issues
 """
 
 import ast
+import os
+import re
 import sys
 import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import parse_cache
+
+try:
+    from tree_sitter_languages import get_language, get_parser
+except ImportError:  # Optional - bulk parsing falls back to ast
+    get_language = get_parser = None
+
+TS_QUERY = """
+(class_definition name: (identifier) @class)
+(function_definition name: (identifier) @function)
+(import_statement) @import
+(import_from_statement) @import_from
+"""
+TS_CALL_QUERY = "(call function: (_) @call)"
+_ts = None
+
+# Only the first HEAD_SIZE names of each kind are kept; the rest are just counted
+HEAD_SIZE = 10
+
+# Import statements starting a line or following a ';': "from <module> import <names>" or "import <names>"
+IMPORT_RE = re.compile(
+    rb'(?m)(?:^|;)[ \t]*(?:from[ \t]+([\w.]+)[ \t]+import[ \t]+(\([^)]*\)|(?:[^\n#;\\]|\\\r?\n)+)'
+    rb'|import[ \t]+((?:[^\n#;\\]|\\\r?\n)+))'
+)
+
+
+class Collector(ast.NodeVisitor):
+    """Count classes, functions and imports in a single pass, keeping only the first few"""
+    
+    def __init__(self):
+        self.class_count = 0
+        self.class_head = []
+        self.func_count = 0
+        self.func_head = []
+        self.import_count = 0
+        self.import_head = []
+        self.first_function = None
+    
+    def visit_ClassDef(self, node):
+        self.class_count += 1
+        if len(self.class_head) < HEAD_SIZE:
+            self.class_head.append((node.name, node.lineno))
+        self.generic_visit(node)
+    
+    def visit_FunctionDef(self, node):
+        self.func_count += 1
+        if len(self.func_head) < HEAD_SIZE:
+            self.func_head.append((node.name, node.lineno))
+        if self.first_function is None:
+            self.first_function = node
+        self.generic_visit(node)
+    
+    visit_AsyncFunctionDef = visit_FunctionDef
+    
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._add_import(alias.name)
+        self.generic_visit(node)
+    
+    def visit_ImportFrom(self, node):
+        module = node.module or ""
+        for alias in node.names:
+            self._add_import(f"{module}.{alias.name}")
+        self.generic_visit(node)
+    
+    def _add_import(self, name):
+        self.import_count += 1
+        if len(self.import_head) < HEAD_SIZE:
+            self.import_head.append(name)
+
+
+def _dotted(node):
+    """Build a dotted name like 'self.repo.create' without running the unparser"""
+    parts = []
+    cur = node
+    while isinstance(cur, ast.Attribute):
+        parts.append(cur.attr)
+        cur = cur.value
+    if isinstance(cur, ast.Name):
+        parts.append(cur.id)
+        return '.'.join(reversed(parts))
+    # Calls, subscripts, etc. in the chain - fall back to the full unparser
+    return ast.unparse(node)
+
+
+def _import_names(raw):
+    """Split an import name list, dropping parentheses, comments and 'as' aliases"""
+    raw = re.sub(rb'#[^\n]*', b'', raw).strip(b'()')
+    names = []
+    for part in raw.replace(b'\\', b' ').split(b','):
+        words = part.split()
+        if words:
+            names.append(words[0].decode('utf-8', errors='replace'))
+    return names
+
+
+def quick_imports(code):
+    """
+    Extract imports from source bytes with a regex instead of a full parse.
+    
+    Much cheaper than ast for dependency-graph callers that need nothing else,
+    but lexical: an import-looking line (or ';'-separated statement) inside a
+    string literal is reported too, and an import in a one-line compound
+    statement body (e.g. "if x: import y") is missed.
+    Names are formatted like Collector's ("module.name" for from-imports).
+    """
+    imports = []
+    for module, from_names, names in IMPORT_RE.findall(code):
+        if names:
+            imports.extend(_import_names(names))
+        else:
+            # Relative dots live in node.level for ast, so drop them to match
+            prefix = module.lstrip(b'.').decode('utf-8', errors='replace')
+            imports.extend(f"{prefix}.{name}" for name in _import_names(from_names))
+    return imports
+
+
+def _call_name(call):
+    """Display name for a call target, or None if it is not a plain/dotted name"""
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    if isinstance(call.func, ast.Attribute):
+        return _dotted(call.func)
+    return None
+
+
+def summarize(code, file_path):
+    """Parse source bytes and reduce the tree to a picklable summary"""
+    tree = ast.parse(code, filename=file_path, type_comments=False)
+    
+    # Collect classes, functions and imports in one traversal
+    collector = Collector()
+    collector.visit(tree)
+    
+    # Sample method calls from the first function
+    first_function = collector.first_function
+    calls = []
+    if first_function is not None:
+        calls = [_call_name(node) for node in ast.walk(first_function) if isinstance(node, ast.Call)]
+    
+    return {
+        'size': len(code),
+        'class_count': collector.class_count,
+        'classes': collector.class_head,
+        'function_count': collector.func_count,
+        'functions': collector.func_head,
+        'import_count': collector.import_count,
+        'imports': collector.import_head,
+        'first_function': first_function.name if first_function is not None else None,
+        'calls': calls,
+    }
+
+
+def _tree_sitter():
+    """Lazily build the Tree-sitter parser and queries (once per process)"""
+    global _ts
+    if _ts is None:
+        language = get_language('python')
+        _ts = (get_parser('python'), language.query(TS_QUERY), language.query(TS_CALL_QUERY))
+    return _ts
+
+
+def _ts_text(node):
+    return node.text.decode('utf-8', errors='replace')
+
+
+def _ts_imports(node):
+    """Import names from an import / import-from node, formatted like Collector"""
+    names = []
+    for child in node.children_by_field_name('name'):
+        if child.type == 'aliased_import':
+            child = child.child_by_field_name('name')
+        names.append(_ts_text(child))
+    if node.type == 'import_statement':
+        return names
+    
+    # Relative dots live in node.level for ast, so drop them to match
+    module = _ts_text(node.child_by_field_name('module_name')).lstrip('.')
+    if any(child.type == 'wildcard_import' for child in node.children):
+        names.append('*')
+    return [f"{module}.{name}" for name in names]
+
+
+def _ts_call_name(node):
+    """Display name for a call target, or None if it is not a plain/dotted name"""
+    if node.type not in ('identifier', 'attribute'):
+        return None
+    return re.sub(r'\s+', '', _ts_text(node))
+
+
+def summarize_tree_sitter(code, file_path):
+    """
+    Summarize source bytes with Tree-sitter, falling back to ast on parse errors.
+    
+    The file is not re-validated with ast (that would cost the full parse this
+    path avoids), so anything the Tree-sitter grammar accepts counts as parsed.
+    The grammar is looser than the interpreter - Python 2 print/exec statements
+    parse cleanly - so with the optional package installed, --dir can report
+    such files as parsed where the ast path reports a SyntaxError.
+    """
+    parser, query, call_query = _tree_sitter()
+    tree = parser.parse(code)
+    if tree.root_node.has_error:
+        return summarize(code, file_path)
+    
+    counts = {'class': 0, 'function': 0, 'import': 0}
+    classes, functions, imports = [], [], []
+    first_function_node = None
+    for node, capture in query.captures(tree.root_node):
+        lineno = node.start_point[0] + 1
+        if capture == 'class':
+            counts['class'] += 1
+            if len(classes) < HEAD_SIZE:
+                classes.append((_ts_text(node), lineno))
+        elif capture == 'function':
+            counts['function'] += 1
+            if first_function_node is None:
+                first_function_node = node.parent
+            if len(functions) < HEAD_SIZE:
+                functions.append((_ts_text(node), lineno))
+        else:
+            names = _ts_imports(node)
+            counts['import'] += len(names)
+            imports.extend(names[:HEAD_SIZE - len(imports)])
+    
+    calls = []
+    if first_function_node is not None:
+        calls = [_ts_call_name(node) for node, _ in call_query.captures(first_function_node)]
+    
+    return {
+        'size': len(code),
+        'class_count': counts['class'],
+        'classes': classes,
+        'function_count': counts['function'],
+        'functions': functions,
+        'import_count': counts['import'],
+        'imports': imports,
+        'first_function': functions[0][0] if functions else None,
+        'calls': calls,
+    }
+
+
+def parse_one(path):
+    """Summarize one file without printing; failures are returned, not raised"""
+    parse = summarize_tree_sitter if get_parser is not None else summarize
+    try:
+        summary, _ = parse_cache.get_or_parse(path, parse)
+    except (SyntaxError, ValueError, OSError) as e:
+        return {'path': path, 'error': f"{type(e).__name__}: {e}"}
+    return {'path': path, **summary}
+
+
+def parse_all(paths, workers=None):
+    """Summarize many files across processes (ast parsing is CPU-bound and holds the GIL)"""
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        return list(ex.map(parse_one, paths, chunksize=16))
+
+
+def _emit(out):
+    """Write buffered report lines to stdout in one call"""
+    if out:
+        sys.stdout.write('\n'.join(out) + '\n')
+        out.clear()
+
+
+def test_python_dir(root):
+    """Test parsing every .py file under a directory"""
+    
+    out = []
+    p = out.append
+    p(f"🔍 Testing Python AST Parser on directory: {root}")
+    p("=" * 60)
+    p("")
+    
+    paths = [str(path) for path in sorted(Path(root).glob('**/*.py'))]
+    results = parse_all(paths)
+    parsed = [r for r in results if 'error' not in r]
+    failed = [r for r in results if 'error' in r]
+    
+    p(f"📂 Files found: {len(paths)}")
+    p(f"✅ Parsed: {len(parsed)}")
+    p(f"📦 Classes found: {sum(r['class_count'] for r in parsed)}")
+    p(f"🔧 Functions found: {sum(r['function_count'] for r in parsed)}")
+    p(f"📥 Imports found: {sum(r['import_count'] for r in parsed)}")
+    p("")
+    
+    if failed:
+        p(f"❌ Failed: {len(failed)}")
+        for r in failed[:10]:
+            p(f"   - {r['path']}: {r['error']}")
+        if len(failed) > 10:
+            p(f"   ... and {len(failed) - 10} more")
+        p("")
+    
+    p("=" * 60)
+    p("✅ PYTHON AST PARSING: SUCCESS!" if not failed else "❌ PYTHON AST PARSING: FAILURES")
+    p("=" * 60)
+    _emit(out)
+    return not failed
+
+
+def test_python_imports(file_path):
+    """List a file's imports via the regex fast path (no AST)"""
+    
+    out = []
+    p = out.append
+    p(f"🔍 Extracting imports from: {file_path}")
+    p("=" * 60)
+    p("")
+    
+    try:
+        with open(file_path, 'rb') as f:
+            imports = quick_imports(f.read())
+    except OSError as e:
+        _emit(out)
+        print(f"❌ ERROR: {type(e).__name__}: {e}")
+        return False
+    
+    p(f"📥 Imports found: {len(imports)}")
+    for imp in imports:
+        p(f"   - {imp}")
+    p("")
+    _emit(out)
+    return True
+
 
 def test_python_parser(file_path):
     """Test parsing a Python file with ast module"""
     
-    print(f"🔍 Testing Python AST Parser on: {file_path}")
-    print("=" * 60)
-    print()
+    out = []
+    p = out.append
+    p(f"🔍 Testing Python AST Parser on: {file_path}")
+    p("=" * 60)
+    p("")
     
     try:
-        # Read the file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            code = f.read()
+        # Reuse the cached summary unless the file changed since it was parsed
+        summary, from_cache = parse_cache.get_or_parse(file_path, summarize)
         
-        print(f"✅ File read successfully ({len(code)} chars)")
-        print()
-        
-        # Parse with Python AST
-        tree = ast.parse(code, file_path)
-        print("✅ AST parsing successful")
-        print()
+        if from_cache:
+            p(f"✅ Summary loaded from cache ({summary['size']} bytes)")
+        else:
+            p(f"✅ File read successfully ({summary['size']} bytes)")
+            p("")
+            p("✅ AST parsing successful")
+        p("")
         
         # Extract classes
-        classes = [node for node in ast.walk(tree) if isinstance(node, ast.ClassDef)]
-        print(f"📦 Classes found: {len(classes)}")
-        for cls in classes:
-            print(f"   - {cls.name} (line {cls.lineno})")
-        print()
+        class_count = summary['class_count']
+        p(f"📦 Classes found: {class_count}")
+        for name, lineno in summary['classes']:
+            p(f"   - {name} (line {lineno})")
+        if class_count > HEAD_SIZE:
+            p(f"   ... and {class_count - HEAD_SIZE} more")
+        p("")
         
         # Extract functions
-        functions = [node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
-        print(f"🔧 Functions found: {len(functions)}")
-        for func in functions[:10]:  # First 10
-            print(f"   - {func.name} (line {func.lineno})")
-        if len(functions) > 10:
-            print(f"   ... and {len(functions) - 10} more")
-        print()
+        function_count = summary['function_count']
+        p(f"🔧 Functions found: {function_count}")
+        for name, lineno in summary['functions']:
+            p(f"   - {name} (line {lineno})")
+        if function_count > HEAD_SIZE:
+            p(f"   ... and {function_count - HEAD_SIZE} more")
+        p("")
         
         # Extract imports
-        imports = []
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    imports.append(alias.name)
-            elif isinstance(node, ast.ImportFrom):
-                module = node.module or ""
-                for alias in node.names:
-                    imports.append(f"{module}.{alias.name}")
-        
-        print(f"📥 Imports found: {len(imports)}")
-        for imp in imports[:10]:
-            print(f"   - {imp}")
-        if len(imports) > 10:
-            print(f"   ... and {len(imports) - 10} more")
-        print()
+        import_count = summary['import_count']
+        p(f"📥 Imports found: {import_count}")
+        for imp in summary['imports']:
+            p(f"   - {imp}")
+        if import_count > HEAD_SIZE:
+            p(f"   ... and {import_count - HEAD_SIZE} more")
+        p("")
         
         # Extract method calls (sample from first function)
-        if functions:
-            first_func = functions[0]
-            calls = [node for node in ast.walk(first_func) if isinstance(node, ast.Call)]
-            print(f"📞 Method calls in {first_func.name}(): {len(calls)}")
-            for call in calls[:5]:
-                if isinstance(call.func, ast.Name):
-                    print(f"   - {call.func.id}()")
-                elif isinstance(call.func, ast.Attribute):
-                    print(f"   - {ast.unparse(call.func)}()")
-        print()
+        if summary['first_function']:
+            calls = summary['calls']
+            p(f"📞 Method calls in {summary['first_function']}(): {len(calls)}")
+            for name in calls[:5]:
+                if name is not None:
+                    p(f"   - {name}()")
+        p("")
         
-        print("=" * 60)
-        print("✅ PYTHON AST PARSING: SUCCESS!")
-        print("=" * 60)
+        p("=" * 60)
+        p("✅ PYTHON AST PARSING: SUCCESS!")
+        p("=" * 60)
+        _emit(out)
         return True
         
     except SyntaxError as e:
+        _emit(out)
         print(f"❌ SYNTAX ERROR: {e}")
         print(f"   Line {e.lineno}: {e.text}")
         return False
     except Exception as e:
+        _emit(out)
         print(f"❌ ERROR: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
         return False
 
 if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--dir':
+        success = test_python_dir(sys.argv[2])
+        sys.exit(0 if success else 1)
+    
+    if len(sys.argv) > 2 and sys.argv[1] == '--imports':
+        success = test_python_imports(sys.argv[2])
+        sys.exit(0 if success else 1)
+    
     if len(sys.argv) > 1:
         file_path = sys.argv[1]
     else:
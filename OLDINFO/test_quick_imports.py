@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for the regex import fast path (quick_imports) against ast
+
+Run with: python -m unittest discover -s OLDINFO
+"""
+
+import unittest
+
+from test_python_parser import HEAD_SIZE, quick_imports, summarize
+
+CASES = {
+    'plain': b"import os\nimport os.path\n",
+    'comma list with alias': b"import os, sys as system, json\n",
+    'trailing comment': b"import json  # stdlib\nfrom a import b  # why\n",
+    'parenthesised': b"from pkg.mod import (\n    a,\n    b as c,  # renamed\n    d,\n)\n",
+    'backslash continuation': b"from pkg import a, \\\n    b\nimport x, \\\n    y\n",
+    'semicolons': b"import os; import sys\nx = 1; from y import z\n",
+    'relative': b"from . import sibling\nfrom ..rel import thing as other\n",
+    'star': b"from m import *\n",
+    'indented': b"def f():\n    import lazy\n    from lazy import thing\n",
+}
+
+
+def ast_imports(code):
+    """Import names as Collector reports them"""
+    summary = summarize(code, '<test>')
+    assert summary['import_count'] <= HEAD_SIZE
+    return summary['imports']
+
+
+class QuickImportsTests(unittest.TestCase):
+
+    def test_matches_ast(self):
+        for name, code in CASES.items():
+            with self.subTest(name):
+                self.assertEqual(quick_imports(code), ast_imports(code))
+
+    def test_import_inside_string_is_reported(self):
+        # Documented lexical limitation
+        code = b'DOC = """\nimport fake\n"""\n'
+        self.assertEqual(quick_imports(code), ['fake'])
+        self.assertEqual(ast_imports(code), [])
+
+    def test_import_in_one_line_compound_body_is_missed(self):
+        # Documented lexical limitation
+        code = b"if True: import y\n"
+        self.assertEqual(quick_imports(code), [])
+        self.assertEqual(ast_imports(code), ['y'])
+
+
+if __name__ == "__main__":
+    unittest.main()
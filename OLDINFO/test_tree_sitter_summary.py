@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the optional Tree-sitter summary path (summarize_tree_sitter)
+
+Run with: python -m unittest discover -s OLDINFO
+"""
+
+import unittest
+
+import test_python_parser
+from test_python_parser import summarize, summarize_tree_sitter
+
+SAMPLE = b'''"""Sample module"""
+import os, sys as system
+from .pkg import (a, b as c)
+from m import *
+
+
+class Repo:
+    def save(self, item):
+        self.db.insert(item)
+        log(item)
+        return os.path.join("a", "b")
+
+
+async def load():
+    pass
+'''
+
+
+@unittest.skipIf(test_python_parser.get_parser is None, "tree_sitter_languages is not installed")
+class SummarizeTreeSitterTests(unittest.TestCase):
+
+    def test_matches_ast_summary(self):
+        self.assertEqual(summarize_tree_sitter(SAMPLE, '<test>'), summarize(SAMPLE, '<test>'))
+
+    def test_parse_error_falls_back_to_ast(self):
+        with self.assertRaises(SyntaxError):
+            summarize_tree_sitter(b"def broken(:\n", '<test>')
+
+    def test_grammar_accepts_python2_statements(self):
+        # Documented difference from the ast path
+        code = b'print "hello"\n'
+        self.assertEqual(summarize_tree_sitter(code, '<test>')['function_count'], 0)
+        with self.assertRaises(SyntaxError):
+            summarize(code, '<test>')
+
+
+if __name__ == "__main__":
+    unittest.main()